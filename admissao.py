@@ -0,0 +1,106 @@
+# admissao.py
+# Controle de admissão por rota: cada rota configurada consome `peso`
+# unidades de uma capacidade compartilhada, respeita um limite próprio de
+# execuções simultâneas e espera numa fila limitada. Quando a fila está
+# cheia ou a espera acaba, a requisição é recusada na hora (503) em vez
+# de ocupar um worker que as rotas baratas precisam.
+import math
+import threading
+import time
+
+
+class EstadoRota:
+    def __init__(self, peso, limite, fila_maxima, espera_maxima):
+        self.peso = peso
+        self.limite = limite
+        self.fila_maxima = fila_maxima
+        self.espera_maxima = espera_maxima
+        self.em_execucao = 0
+        self.na_fila = 0
+        self.admitidas = 0
+        self.rejeitadas = 0
+        self.expiradas = 0
+
+
+class ControleAdmissao:
+
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self._em_uso = 0
+        self._cond = threading.Condition()
+        self._rotas = {}
+
+    def configurar_rota(self, nome, peso=1, limite=None, fila=0, espera=5):
+        # Peso acima da capacidade nunca seria admitido
+        peso = min(peso, self.capacidade)
+        with self._cond:
+            self._rotas[nome] = EstadoRota(peso, limite, fila, espera)
+
+    def controla(self, nome):
+        return nome in self._rotas
+
+    def retry_after(self, nome):
+        # Sugestão ao cliente: o tempo máximo de espera na fila da rota
+        return max(1, math.ceil(self._rotas[nome].espera_maxima))
+
+    def _pode_executar(self, rota):
+        if rota.limite is not None and rota.em_execucao >= rota.limite:
+            return False
+        return self._em_uso + rota.peso <= self.capacidade
+
+    def _admitir(self, rota):
+        rota.em_execucao += 1
+        rota.admitidas += 1
+        self._em_uso += rota.peso
+
+    def entrar(self, nome):
+        # Retorna True se a requisição foi admitida; quem recebe True deve chamar sair()
+        rota = self._rotas[nome]
+        with self._cond:
+            if rota.na_fila == 0 and self._pode_executar(rota):
+                self._admitir(rota)
+                return True
+            if rota.na_fila >= rota.fila_maxima:
+                rota.rejeitadas += 1
+                return False
+            rota.na_fila += 1
+            fim = time.monotonic() + rota.espera_maxima
+            try:
+                while not self._pode_executar(rota):
+                    restante = fim - time.monotonic()
+                    if restante <= 0:
+                        rota.expiradas += 1
+                        return False
+                    self._cond.wait(restante)
+                self._admitir(rota)
+                return True
+            finally:
+                rota.na_fila -= 1
+
+    def sair(self, nome):
+        rota = self._rotas[nome]
+        with self._cond:
+            rota.em_execucao -= 1
+            self._em_uso -= rota.peso
+            self._cond.notify_all()
+
+    def status(self):
+        with self._cond:
+            return {
+                'capacidade': self.capacidade,
+                'em_uso': self._em_uso,
+                'rotas': {
+                    nome: {
+                        'peso': r.peso,
+                        'limite': r.limite,
+                        'fila_maxima': r.fila_maxima,
+                        'espera_maxima': r.espera_maxima,
+                        'em_execucao': r.em_execucao,
+                        'na_fila': r.na_fila,
+                        'admitidas': r.admitidas,
+                        'rejeitadas': r.rejeitadas,
+                        'expiradas': r.expiradas,
+                    }
+                    for nome, r in self._rotas.items()
+                },
+            }
@@ -1,6 +1,8 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, g
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, g, jsonify, Response, stream_with_context
 import sqlite3
+import json
+import time
 from datetime import datetime
 from functools import wraps
 from reportlab.lib.pagesizes import letter
@@ -9,18 +11,53 @@ from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 import io
 import os
+import manutencao
+import admissao
+import perfilador
 
 app = Flask(__name__)
 app.secret_key = 'sua_chave_secreta_para_sessao'
 
+# Feed de alterações (/changes)
+app.config['ALTERACOES_LIMITE'] = 500            # máximo de alterações por resposta
+app.config['ALTERACOES_RETENCAO_DIAS'] = 30      # lápides de exclusão mais antigas são expiradas
+app.config['SSE_INTERVALO_SEGUNDOS'] = 2         # intervalo de consulta do stream
+app.config['SSE_DURACAO_MAXIMA'] = 300           # o navegador reconecta com Last-Event-ID
+
+# Manutenção do banco: (intervalo entre execuções, prazo máximo de cada execução), em segundos
+app.config['MANUTENCAO'] = {
+    'otimizar': (3600, 5),
+    'checkpoint': (300, 2),
+    'vacuum': (1800, 2),
+    'compactar_alteracoes': (3600, 5),
+}
+
+# Controle de admissão: capacidade total em unidades de peso e, por endpoint,
+# peso, limite de execuções simultâneas, tamanho da fila e espera máxima (s).
+# Endpoints fora da lista não passam pelo controle. O stream SSE passa a maior
+# parte do tempo ocioso e fica aberto por até SSE_DURACAO_MAXIMA: tem peso 0,
+# para não tirar capacidade do PDF, e só o próprio limite o restringe.
+app.config['ADMISSAO_CAPACIDADE'] = 8
+app.config['ADMISSAO_ROTAS'] = {
+    'exportar_pdf': {'peso': 3, 'limite': 2, 'fila': 4, 'espera': 10},
+    'stream_alteracoes': {'peso': 0, 'limite': 4, 'fila': 0, 'espera': 0},
+    'listar_alteracoes': {'peso': 1, 'fila': 8, 'espera': 2},
+}
+
+# Perfilador sob demanda: anel de capturas em disco; ligado pela tela /perfilador
+app.config['PERFILADOR_CAPACIDADE'] = 50
+
 # Detecta ambiente e define nome do banco
 env = os.environ.get("ENV", "desconhecido")
 app.config['ENV'] = env
 db_filename = f"tarefas_{env}.db"
+app.config['PERFILADOR_DIRETORIO'] = f"perfis_{env}"
 
 # Cria banco inicial com usuários e tarefas
 def inicializar_banco():
     conn = sqlite3.connect(db_filename)
+    # Precisa vir antes de qualquer escrita: exclusões passam a liberar páginas para o vacuum incremental
+    manutencao.configurar_auto_vacuum(conn)
     cursor = conn.cursor()
 
     # Tabela de usuários
@@ -49,9 +86,89 @@ def inicializar_banco():
         )
     ''')
 
+    criar_indices_tarefas(cursor)
+    criar_rastreamento_alteracoes(cursor)
+
     conn.commit()
     conn.close()
 
+# Índices usados pelos filtros de período e de tarefas atrasadas.
+# As datas são gravadas como texto ISO (YYYY-MM-DD), então a ordem
+# lexicográfica coincide com a cronológica e o SQLite usa os índices
+# diretamente nas comparações de intervalo.
+def criar_indices_tarefas(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_data_criacao ON tarefas (data_criacao)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_data_prevista ON tarefas (data_prevista)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tarefas_situacao ON tarefas (situacao)')
+    # Os dois índices parciais dividem a tabela entre encerradas e em aberto.
+    # Como o índice de encerramento não contém NULLs, "data_encerramento IS NULL"
+    # não consegue usá-lo, e a consulta de atrasadas percorre pelo prazo só as
+    # tarefas em aberto.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tarefas_encerradas
+        ON tarefas (data_encerramento) WHERE data_encerramento IS NOT NULL
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tarefas_abertas_prevista
+        ON tarefas (data_prevista) WHERE data_encerramento IS NULL
+    ''')
+
+# Feed de alterações: cada insert/update/delete em tarefas gera uma linha em
+# alteracoes_tarefas com um seq crescente (AUTOINCREMENT nunca reaproveita
+# valores, mesmo após a compactação). Exclusões também deixam uma lápide em
+# tarefas_excluidas, usada para expirar exclusões antigas.
+def criar_rastreamento_alteracoes(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alteracoes_tarefas (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tarefa_id INTEGER NOT NULL,
+            operacao TEXT NOT NULL,
+            data_alteracao TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alteracoes_tarefa_seq ON alteracoes_tarefas (tarefa_id, seq)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tarefas_excluidas (
+            tarefa_id INTEGER PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            data_exclusao TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+    # Guarda o horizonte de compactação: cursores anteriores a ele perderam exclusões
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sincronizacao_meta (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_tarefas_insercao AFTER INSERT ON tarefas
+        BEGIN
+            INSERT INTO alteracoes_tarefas (tarefa_id, operacao) VALUES (NEW.id, 'insercao');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_tarefas_atualizacao AFTER UPDATE ON tarefas
+        BEGIN
+            INSERT INTO alteracoes_tarefas (tarefa_id, operacao) VALUES (NEW.id, 'atualizacao');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_tarefas_exclusao AFTER DELETE ON tarefas
+        BEGIN
+            INSERT INTO alteracoes_tarefas (tarefa_id, operacao) VALUES (OLD.id, 'exclusao');
+            INSERT OR REPLACE INTO tarefas_excluidas (tarefa_id, seq) VALUES (OLD.id, last_insert_rowid());
+        END
+    ''')
+    # Tarefas gravadas antes dos triggers existirem entram no feed como inserções;
+    # sem isso, a ressincronização a partir de since=0 não as traria
+    cursor.execute('''
+        INSERT INTO alteracoes_tarefas (tarefa_id, operacao)
+        SELECT id, 'insercao' FROM tarefas
+        WHERE NOT EXISTS (SELECT 1 FROM alteracoes_tarefas a WHERE a.tarefa_id = tarefas.id)
+        ORDER BY id
+    ''')
+
 inicializar_banco()
 
 # Conexão com o banco
@@ -59,6 +176,9 @@ def get_db():
     if 'db' not in g:
         g.db = sqlite3.connect(db_filename)
         g.db.row_factory = sqlite3.Row
+        # Requisições em perfilamento registram os SQL que executam
+        if g.get('perfil') is not None:
+            g.db.set_trace_callback(g.perfil.registrar_sql)
     return g.db
 
 @app.teardown_appcontext
@@ -68,7 +188,42 @@ def close_db(e=None):
         db.close()
 
 # --- Funções de Acesso ao Banco de Dados (CRUD Tarefas) ---
-def obter_tarefas(filtro_descricao=None, filtro_situacao=None):
+
+# Filtros de período: parâmetro -> (coluna, operador). Os limites são inclusivos.
+FILTROS_PERIODO = {
+    'criacao_de': ('data_criacao', '>='),
+    'criacao_ate': ('data_criacao', '<='),
+    'prevista_de': ('data_prevista', '>='),
+    'prevista_ate': ('data_prevista', '<='),
+    'encerramento_de': ('data_encerramento', '>='),
+    'encerramento_ate': ('data_encerramento', '<='),
+}
+
+def normalizar_data(valor):
+    # Aceita apenas datas no formato YYYY-MM-DD; qualquer outro valor é ignorado
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+def converter_tarefa(t):
+    # Converte strings de data para datetime, se não for None
+    data_criacao = datetime.strptime(t['data_criacao'], '%Y-%m-%d') if t['data_criacao'] else None
+    data_prevista = datetime.strptime(t['data_prevista'], '%Y-%m-%d') if t['data_prevista'] else None
+    data_encerramento = datetime.strptime(t['data_encerramento'], '%Y-%m-%d') if t['data_encerramento'] else None
+
+    return {
+        'id': t['id'],
+        'descricao': t['descricao'],
+        'data_criacao': data_criacao,
+        'data_prevista': data_prevista,
+        'data_encerramento': data_encerramento,
+        'situacao': t['situacao']
+    }
+
+def obter_tarefas(filtro_descricao=None, filtro_situacao=None, atrasadas=False, **periodos):
     conn = get_db()
     cursor = conn.cursor()
     sql_query = 'SELECT * FROM tarefas WHERE 1=1'
@@ -79,25 +234,20 @@ def obter_tarefas(filtro_descricao=None, filtro_situacao=None):
     if filtro_situacao:
         sql_query += ' AND situacao = ?'
         params.append(filtro_situacao)
+    for parametro, valor in periodos.items():
+        if parametro not in FILTROS_PERIODO:
+            raise TypeError(f"Filtro de período desconhecido: {parametro}")
+        valor = normalizar_data(valor)
+        if valor:
+            coluna, operador = FILTROS_PERIODO[parametro]
+            sql_query += f' AND {coluna} {operador} ?'
+            params.append(valor)
+    if atrasadas:
+        # Atrasada: prazo vencido e ainda não encerrada
+        sql_query += " AND data_prevista < ? AND data_encerramento IS NULL AND situacao IS NOT 'Concluído'"
+        params.append(datetime.now().strftime('%Y-%m-%d'))
     cursor.execute(sql_query, params)
-    tarefas = cursor.fetchall()
-
-    tarefas_convertidas = []
-    for t in tarefas:
-        # Converte strings de data para datetime, se não for None
-        data_criacao = datetime.strptime(t['data_criacao'], '%Y-%m-%d') if t['data_criacao'] else None
-        data_prevista = datetime.strptime(t['data_prevista'], '%Y-%m-%d') if t['data_prevista'] else None
-        data_encerramento = datetime.strptime(t['data_encerramento'], '%Y-%m-%d') if t['data_encerramento'] else None
-
-        tarefas_convertidas.append({
-            'id': t['id'],
-            'descricao': t['descricao'],
-            'data_criacao': data_criacao,
-            'data_prevista': data_prevista,
-            'data_encerramento': data_encerramento,
-            'situacao': t['situacao']
-        })
-    return tarefas_convertidas
+    return [converter_tarefa(t) for t in cursor.fetchall()]
 
 def adicionar_tarefa_db(descricao, data_prevista):
     conn = get_db()
@@ -118,18 +268,7 @@ def obter_tarefa_por_id(id_tarefa):
     t = cursor.fetchone()
     if not t:
         return None
-    data_criacao = datetime.strptime(t['data_criacao'], '%Y-%m-%d') if t['data_criacao'] else None
-    data_prevista = datetime.strptime(t['data_prevista'], '%Y-%m-%d') if t['data_prevista'] else None
-    data_encerramento = datetime.strptime(t['data_encerramento'], '%Y-%m-%d') if t['data_encerramento'] else None
-
-    return {
-        'id': t['id'],
-        'descricao': t['descricao'],
-        'data_criacao': data_criacao,
-        'data_prevista': data_prevista,
-        'data_encerramento': data_encerramento,
-        'situacao': t['situacao']
-    }
+    return converter_tarefa(t)
 
 def atualizar_tarefa_db(id_tarefa, descricao, data_prevista, data_encerramento, situacao):
     conn = get_db()
@@ -148,6 +287,173 @@ def excluir_tarefa_db(id_tarefa):
     cursor.execute('DELETE FROM tarefas WHERE id = ?', (id_tarefa,))
     conn.commit()
 
+# --- Feed de alterações ---
+def buscar_alteracoes(conn, desde, limite):
+    # Só a alteração mais recente de cada tarefa interessa: o cliente recebe o
+    # estado atual (ou a exclusão) e avança o cursor até o seq retornado
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT a.seq, a.tarefa_id, a.operacao, a.data_alteracao,
+               t.descricao, t.data_criacao, t.data_prevista, t.data_encerramento, t.situacao
+        FROM alteracoes_tarefas a
+        LEFT JOIN tarefas t ON t.id = a.tarefa_id
+        WHERE a.seq > ?
+          AND a.seq = (SELECT MAX(seq) FROM alteracoes_tarefas WHERE tarefa_id = a.tarefa_id)
+        ORDER BY a.seq
+        LIMIT ?
+    ''', (desde, limite))
+    alteracoes = []
+    for a in cursor.fetchall():
+        tarefa = None
+        if a['operacao'] != 'exclusao' and a['descricao'] is not None:
+            tarefa = {
+                'id': a['tarefa_id'],
+                'descricao': a['descricao'],
+                'data_criacao': a['data_criacao'],
+                'data_prevista': a['data_prevista'],
+                'data_encerramento': a['data_encerramento'],
+                'situacao': a['situacao']
+            }
+        alteracoes.append({
+            'seq': a['seq'],
+            'tarefa_id': a['tarefa_id'],
+            'operacao': 'exclusao' if tarefa is None else a['operacao'],
+            'data_alteracao': a['data_alteracao'],
+            'tarefa': tarefa
+        })
+    return alteracoes
+
+def obter_horizonte_alteracoes(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT valor FROM sincronizacao_meta WHERE chave = 'horizonte'")
+    linha = cursor.fetchone()
+    return linha[0] if linha else 0
+
+def compactar_alteracoes(conn, retencao_dias):
+    cursor = conn.cursor()
+    # Remove entradas substituídas por uma alteração mais nova da mesma tarefa;
+    # o feed nunca as retorna, então nenhum cursor é afetado
+    cursor.execute('''
+        DELETE FROM alteracoes_tarefas
+        WHERE seq < (SELECT MAX(seq) FROM alteracoes_tarefas a2
+                     WHERE a2.tarefa_id = alteracoes_tarefas.tarefa_id)
+    ''')
+    removidas = cursor.rowcount
+    # Expira lápides antigas; clientes com cursor anterior a elas precisam ressincronizar
+    cursor.execute("SELECT MAX(seq) FROM tarefas_excluidas WHERE data_exclusao < datetime('now', ?)",
+                   (f'-{retencao_dias} days',))
+    horizonte = cursor.fetchone()[0]
+    if horizonte is not None:
+        cursor.execute('''
+            DELETE FROM alteracoes_tarefas
+            WHERE tarefa_id IN (SELECT tarefa_id FROM tarefas_excluidas WHERE seq <= ?)
+        ''', (horizonte,))
+        removidas += cursor.rowcount
+        cursor.execute('DELETE FROM tarefas_excluidas WHERE seq <= ?', (horizonte,))
+        cursor.execute('''
+            INSERT INTO sincronizacao_meta (chave, valor) VALUES ('horizonte', ?)
+            ON CONFLICT(chave) DO UPDATE SET valor = MAX(valor, excluded.valor)
+        ''', (horizonte,))
+    conn.commit()
+    return removidas
+
+# --- Manutenção do banco ---
+def compactar_alteracoes_com_prazo(conn, segundos):
+    # Os DELETEs correlacionados percorrem todo o log; o prazo desfaz a transação se estourar
+    with manutencao.prazo(conn, segundos):
+        removidas = compactar_alteracoes(conn, app.config['ALTERACOES_RETENCAO_DIAS'])
+    return {'removidas': removidas}
+
+def criar_agendador_manutencao():
+    agendador = manutencao.AgendadorManutencao(db_filename, logger=app.logger)
+    tarefas = {
+        'otimizar': manutencao.otimizar,
+        'checkpoint': manutencao.checkpoint_wal,
+        'vacuum': manutencao.vacuum_incremental,
+        'compactar_alteracoes': compactar_alteracoes_com_prazo,
+    }
+    for nome, funcao in tarefas.items():
+        intervalo, prazo = app.config['MANUTENCAO'][nome]
+        agendador.registrar(nome, funcao, intervalo, prazo)
+    return agendador
+
+agendador_manutencao = criar_agendador_manutencao()
+
+# --- Controle de admissão ---
+def criar_controle_admissao():
+    controle = admissao.ControleAdmissao(app.config['ADMISSAO_CAPACIDADE'])
+    for endpoint, parametros in app.config['ADMISSAO_ROTAS'].items():
+        controle.configurar_rota(endpoint, **parametros)
+    return controle
+
+controle_admissao = criar_controle_admissao()
+
+# Respostas em stream seguram o worker até o fim do stream, mas o contexto da
+# requisição é desmontado assim que a view retorna (stream_with_context só o
+# reempilha durante a iteração). Essas rotas reservam a vaga na própria view
+# e a liberam quando o stream termina.
+ENDPOINTS_ADMISSAO_NA_VIEW = {'stream_alteracoes'}
+
+def resposta_sobrecarga(controle, endpoint):
+    segundos = controle.retry_after(endpoint)
+    return (f'Servidor sobrecarregado. Tente novamente em {segundos} segundos.', 503,
+            {'Retry-After': str(segundos)})
+
+@app.before_request
+def admitir_requisicao():
+    endpoint = request.endpoint
+    if not endpoint or endpoint in ENDPOINTS_ADMISSAO_NA_VIEW or not controle_admissao.controla(endpoint):
+        return None
+    # Sem login a requisição só será redirecionada: não ocupa vaga nem fila
+    if not session.get('logged_in'):
+        return None
+    if not controle_admissao.entrar(endpoint):
+        return resposta_sobrecarga(controle_admissao, endpoint)
+    # Guarda o controle usado na entrada: a saída precisa liberar no mesmo lugar
+    g.admissao = (controle_admissao, endpoint)
+    return None
+
+@app.teardown_request
+def liberar_admissao(e=None):
+    admitida = g.pop('admissao', None)
+    if admitida is not None:
+        controle, endpoint = admitida
+        controle.sair(endpoint)
+
+# --- Perfilador ---
+perfilador_requisicoes = perfilador.Perfilador(app.config['PERFILADOR_DIRETORIO'],
+                                               app.config['PERFILADOR_CAPACIDADE'])
+
+# As telas do próprio perfilador, o login (recebe a senha) e os arquivos
+# estáticos nunca são capturados
+ENDPOINTS_SEM_PERFIL = {'static', 'perfilador_admin', 'login'}
+
+@app.before_request
+def iniciar_perfil():
+    if request.endpoint in ENDPOINTS_SEM_PERFIL or not perfilador_requisicoes.deve_perfilar(request.endpoint):
+        return None
+    g.perfil = perfilador_requisicoes.iniciar_captura(request.endpoint, request.method, request.full_path.rstrip('?'))
+    return None
+
+@app.after_request
+def registrar_status_perfil(response):
+    if g.get('perfil') is not None:
+        g.perfil_status = response.status_code
+    return response
+
+@app.teardown_request
+def finalizar_perfil(e=None):
+    captura = g.pop('perfil', None)
+    if captura is None:
+        return
+    if 'db' in g:
+        g.db.set_trace_callback(None)
+    status = 500 if e is not None else g.pop('perfil_status', None)
+    try:
+        perfilador_requisicoes.finalizar_captura(captura, status)
+    except OSError as erro:
+        app.logger.warning('Falha ao gravar captura do perfilador: %s', erro)
+
 # --- Funções de acesso para usuários ---
 def verificar_usuario(username, password):
     conn = get_db()
@@ -166,6 +472,17 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Lê da query string os filtros compartilhados pela listagem e pelo PDF
+def obter_filtros_requisicao():
+    filtros = {
+        'filtro_descricao': request.args.get('filtro_descricao'),
+        'filtro_situacao': request.args.get('filtro_situacao'),
+        'atrasadas': request.args.get('atrasadas') == '1',
+    }
+    for parametro in FILTROS_PERIODO:
+        filtros[parametro] = normalizar_data(request.args.get(parametro))
+    return filtros
+
 # --- Rotas ---
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -189,13 +506,13 @@ def logout():
 @app.route('/')
 @login_required
 def listar_tarefas():
-    filtro_descricao = request.args.get('filtro_descricao')
-    filtro_situacao = request.args.get('filtro_situacao')
-    tarefas = obter_tarefas(filtro_descricao=filtro_descricao, filtro_situacao=filtro_situacao)
+    filtros = obter_filtros_requisicao()
+    tarefas = obter_tarefas(**filtros)
     return render_template('listar_tarefas.html',
                            tarefas=tarefas,
-                           filtro_descricao=filtro_descricao,
-                           filtro_situacao=filtro_situacao)
+                           filtros=filtros,
+                           filtro_descricao=filtros['filtro_descricao'],
+                           filtro_situacao=filtros['filtro_situacao'])
 
 @app.route('/adicionar', methods=['GET', 'POST'])
 @login_required
@@ -236,10 +553,11 @@ def excluir_tarefa(id):
 @app.route('/exportar-pdf')
 @login_required
 def exportar_pdf():
-    filtro_descricao = request.args.get('filtro_descricao')
-    filtro_situacao = request.args.get('filtro_situacao')
+    filtros = obter_filtros_requisicao()
+    filtro_descricao = filtros['filtro_descricao']
+    filtro_situacao = filtros['filtro_situacao']
 
-    tarefas = obter_tarefas(filtro_descricao=filtro_descricao, filtro_situacao=filtro_situacao)
+    tarefas = obter_tarefas(**filtros)
 
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter)
@@ -259,6 +577,13 @@ def exportar_pdf():
         filter_info += f"Descrição contendo '{filtro_descricao}'. "
     if filtro_situacao:
         filter_info += f"Situação: '{filtro_situacao}'. "
+    for rotulo, inicio, fim in (('Criação', 'criacao_de', 'criacao_ate'),
+                                ('Prevista', 'prevista_de', 'prevista_ate'),
+                                ('Encerramento', 'encerramento_de', 'encerramento_ate')):
+        if filtros[inicio] or filtros[fim]:
+            filter_info += f"{rotulo}: {filtros[inicio] or '...'} a {filtros[fim] or '...'}. "
+    if filtros['atrasadas']:
+        filter_info += "Somente atrasadas. "
 
     try:
         normal_style = styles['Normal']
@@ -306,5 +631,125 @@ def exportar_pdf():
     buffer.seek(0)
     return send_file(buffer, as_attachment=True, download_name='lista_de_tarefas_filtrada.pdf', mimetype='application/pdf')
 
+def ler_cursor_alteracoes(valor):
+    try:
+        return max(int(valor or 0), 0)
+    except ValueError:
+        return None
+
+@app.route('/manutencao/status')
+@login_required
+def status_manutencao():
+    return jsonify(agendador_manutencao.status())
+
+@app.route('/admissao/status')
+@login_required
+def status_admissao():
+    return jsonify(controle_admissao.status())
+
+@app.route('/perfilador', methods=['GET', 'POST'])
+@login_required
+def perfilador_admin():
+    if request.method == 'POST':
+        try:
+            perfilador_requisicoes.configurar(
+                ativo=request.form.get('ativo') == '1',
+                taxa=request.form.get('taxa') or 0,
+                rotas=request.form.getlist('rotas'),
+                modo=request.form.get('modo', 'amostragem'),
+                limiar_ms=request.form.get('limiar_ms') or 0,
+            )
+            flash('Configuração do perfilador atualizada.', 'success')
+        except ValueError as e:
+            flash(f'Configuração inválida: {e}', 'danger')
+        return redirect(url_for('perfilador_admin'))
+    endpoints = sorted(regra.endpoint for regra in app.url_map.iter_rules()
+                       if regra.endpoint not in ENDPOINTS_SEM_PERFIL)
+    return render_template('perfilador.html',
+                           config=perfilador_requisicoes.configuracao(),
+                           endpoints=endpoints,
+                           modos=perfilador.MODOS,
+                           cprofile_por_processo=perfilador.CPROFILE_POR_PROCESSO,
+                           capturas=perfilador_requisicoes.mais_lentas())
+
+@app.route('/changes')
+@login_required
+def listar_alteracoes():
+    desde = ler_cursor_alteracoes(request.args.get('since'))
+    if desde is None:
+        return jsonify({'erro': "Parâmetro 'since' inválido."}), 400
+    limite = request.args.get('limite', app.config['ALTERACOES_LIMITE'], type=int)
+    limite = max(1, min(limite, app.config['ALTERACOES_LIMITE']))
+
+    conn = get_db()
+    horizonte = obter_horizonte_alteracoes(conn)
+    if 0 < desde < horizonte:
+        # Exclusões anteriores ao horizonte já foram compactadas: o cliente precisa recomeçar de since=0
+        return jsonify({'erro': 'Cursor expirado, ressincronize a partir de since=0.', 'horizonte': horizonte}), 410
+
+    alteracoes = buscar_alteracoes(conn, desde, limite)
+    return jsonify({
+        'alteracoes': alteracoes,
+        'cursor': alteracoes[-1]['seq'] if alteracoes else desde,
+        'mais': len(alteracoes) == limite
+    })
+
+@app.route('/changes/stream')
+@login_required
+def stream_alteracoes():
+    desde = ler_cursor_alteracoes(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    if desde is None:
+        return jsonify({'erro': "Parâmetro 'since' inválido."}), 400
+    intervalo = app.config['SSE_INTERVALO_SEGUNDOS']
+    duracao_maxima = app.config['SSE_DURACAO_MAXIMA']
+    limite = app.config['ALTERACOES_LIMITE']
+
+    # A vaga vale pela duração do stream (ver ENDPOINTS_ADMISSAO_NA_VIEW)
+    controle = controle_admissao
+    if not controle.entrar('stream_alteracoes'):
+        return resposta_sobrecarga(controle, 'stream_alteracoes')
+    liberada = []
+
+    def liberar_vaga():
+        # Chamada no fim do gerador e no fechamento da resposta; libera uma única vez.
+        # O fechamento cobre o cliente que desconecta antes do gerador começar.
+        if not liberada:
+            liberada.append(True)
+            controle.sair('stream_alteracoes')
+
+    def eventos(desde):
+        # Conexão própria: o stream vive além do ciclo normal do request
+        conn = sqlite3.connect(db_filename)
+        conn.row_factory = sqlite3.Row
+        fim = time.monotonic() + duracao_maxima
+        try:
+            yield f'retry: {intervalo * 1000}\n\n'
+            horizonte = obter_horizonte_alteracoes(conn)
+            if 0 < desde < horizonte:
+                yield f'event: ressincronizar\ndata: {json.dumps({"horizonte": horizonte})}\n\n'
+                return
+            while True:
+                alteracoes = buscar_alteracoes(conn, desde, limite)
+                for alteracao in alteracoes:
+                    desde = alteracao['seq']
+                    yield f'id: {desde}\nevent: alteracao\ndata: {json.dumps(alteracao, ensure_ascii=False)}\n\n'
+                if not alteracoes:
+                    yield ': ping\n\n'
+                if time.monotonic() >= fim:
+                    break
+                if len(alteracoes) < limite:
+                    time.sleep(intervalo)
+        finally:
+            conn.close()
+            liberar_vaga()
+
+    resposta = Response(stream_with_context(eventos(desde)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    resposta.call_on_close(liberar_vaga)
+    return resposta
+
 if __name__ == '__main__':
+    # Com o reloader do modo debug, só o processo filho (que serve as requisições) roda a manutenção
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        agendador_manutencao.iniciar()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,414 @@
+# carga.py
+# Gerador de carga local: sobe o app contra um banco semeado (tarefas_{env}.db)
+# e simula usuários virtuais concorrentes com uma mistura ponderada de cenários.
+#
+# Uso:
+#   python carga.py --usuarios 20 --duracao 60 --mix listar=50,filtrar=20,adicionar=10,editar=15,exportar=5
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+MIX_PADRAO = {
+    'listar': 45,
+    'filtrar': 20,
+    'adicionar': 10,
+    'editar': 15,
+    'exportar': 5,
+    'login': 5,
+}
+
+SITUACOES = ['Pendente', 'Em andamento', 'Concluído']
+PALAVRAS = ['relatório', 'reunião', 'cliente', 'deploy', 'revisão', 'contrato', 'backup', 'treinamento']
+
+# Cabeçalho usado pelo servidor de carga para sinalizar timeout de lock do SQLite
+CABECALHO_LOCK = 'X-Carga-Erro'
+
+
+# --- Banco semeado ---
+def semear_banco(db_filename, quantidade):
+    """Garante que o banco tenha pelo menos `quantidade` tarefas sintéticas."""
+    conn = sqlite3.connect(db_filename)
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM tarefas')
+    existentes = cursor.fetchone()[0]
+    hoje = datetime.now()
+    tarefas = []
+    for i in range(existentes, quantidade):
+        criacao = hoje - timedelta(days=random.randint(0, 365))
+        prevista = criacao + timedelta(days=random.randint(1, 60))
+        situacao = random.choice(SITUACOES)
+        encerramento = None
+        if situacao == 'Concluído':
+            encerramento = (prevista + timedelta(days=random.randint(-5, 5))).strftime('%Y-%m-%d')
+        tarefas.append((
+            f"{random.choice(PALAVRAS).capitalize()} {i + 1}",
+            criacao.strftime('%Y-%m-%d'),
+            prevista.strftime('%Y-%m-%d'),
+            encerramento,
+            situacao,
+        ))
+    if tarefas:
+        cursor.executemany('''
+            INSERT INTO tarefas (descricao, data_criacao, data_prevista, data_encerramento, situacao)
+            VALUES (?, ?, ?, ?, ?)
+        ''', tarefas)
+        conn.commit()
+    conn.close()
+    return max(existentes, quantidade)
+
+
+# --- Servidor (processo filho) ---
+def executar_servidor(porta, quantidade_tarefas):
+    """Importa o app (que cria o schema), semeia o banco e serve com threads."""
+    import app as aplicacao
+
+    semear_banco(aplicacao.db_filename, quantidade_tarefas)
+
+    # Timeouts de lock viram 503 marcados, para o gerador contabilizá-los à parte
+    @aplicacao.app.errorhandler(sqlite3.OperationalError)
+    def tratar_lock(erro):
+        if 'locked' in str(erro) or 'busy' in str(erro):
+            return 'database is locked', 503, {CABECALHO_LOCK: 'lock'}
+        return 'erro de banco', 500
+
+    aplicacao.app.run(host='127.0.0.1', port=porta, debug=False, threaded=True, use_reloader=False)
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def ler_rss_kb(pid):
+    """RSS do processo em KB, lido de /proc (Linux). Retorna None se indisponível."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for linha in f:
+                if linha.startswith('VmRSS:'):
+                    return int(linha.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+# --- Métricas ---
+def percentil(valores, p):
+    """Percentil por interpolação linear sobre uma lista já ordenada."""
+    if not valores:
+        return 0.0
+    if len(valores) == 1:
+        return valores[0]
+    posicao = (len(valores) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores) - 1)
+    fracao = posicao - inferior
+    return valores[inferior] + (valores[superior] - valores[inferior]) * fracao
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}   # rota -> [segundos]
+        self.erros = {}       # rota -> quantidade
+        self.locks = {}       # rota -> quantidade de timeouts de lock
+        self.rss = []         # [(segundos desde o início, KB)]
+
+    def registrar(self, rota, duracao, erro=False, lock=False):
+        with self._lock:
+            self.latencias.setdefault(rota, []).append(duracao)
+            if erro:
+                self.erros[rota] = self.erros.get(rota, 0) + 1
+            if lock:
+                self.locks[rota] = self.locks.get(rota, 0) + 1
+
+    def relatorio(self, duracao_total):
+        rotas = {}
+        total = 0
+        total_erros = 0
+        total_locks = 0
+        for rota, valores in sorted(self.latencias.items()):
+            ordenados = sorted(valores)
+            erros = self.erros.get(rota, 0)
+            locks = self.locks.get(rota, 0)
+            total += len(ordenados)
+            total_erros += erros
+            total_locks += locks
+            rotas[rota] = {
+                'requisicoes': len(ordenados),
+                'vazao_rps': round(len(ordenados) / duracao_total, 2) if duracao_total else 0,
+                'p50_ms': round(percentil(ordenados, 50) * 1000, 1),
+                'p90_ms': round(percentil(ordenados, 90) * 1000, 1),
+                'p95_ms': round(percentil(ordenados, 95) * 1000, 1),
+                'p99_ms': round(percentil(ordenados, 99) * 1000, 1),
+                'max_ms': round(ordenados[-1] * 1000, 1),
+                'taxa_erro': round(erros / len(ordenados), 4),
+                'taxa_lock': round(locks / len(ordenados), 4),
+            }
+        return {
+            'duracao_s': round(duracao_total, 2),
+            'requisicoes': total,
+            'vazao_rps': round(total / duracao_total, 2) if duracao_total else 0,
+            'taxa_erro': round(total_erros / total, 4) if total else 0,
+            'taxa_lock': round(total_locks / total, 4) if total else 0,
+            'rotas': rotas,
+            'rss_kb': self.rss,
+        }
+
+
+# --- Usuário virtual ---
+class SemRedirecionamento(urllib.request.HTTPRedirectHandler):
+    # Cada amostra mede só a própria rota; o redirecionamento vira uma requisição separada
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class UsuarioVirtual:
+    def __init__(self, base_url, metricas, mix, pensar, timeout):
+        self.base_url = base_url
+        self.metricas = metricas
+        self.cenarios = list(mix.keys())
+        self.pesos = list(mix.values())
+        self.pensar = pensar
+        self.timeout = timeout
+        self.ids_conhecidos = []
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            SemRedirecionamento(),
+        )
+
+    def requisitar(self, rota, caminho, dados=None):
+        """Executa uma requisição e registra latência, erro e lock.
+
+        Retorna (corpo, destino): o corpo da resposta, ou o caminho do
+        redirecionamento quando o servidor responde 3xx (não seguido aqui).
+        """
+        url = self.base_url + caminho
+        corpo = urllib.parse.urlencode(dados).encode() if dados is not None else None
+        inicio = time.perf_counter()
+        erro = False
+        lock = False
+        conteudo = None
+        destino = None
+        try:
+            with self.opener.open(url, data=corpo, timeout=self.timeout) as resposta:
+                conteudo = resposta.read()
+        except urllib.error.HTTPError as e:
+            if e.code in (301, 302, 303):
+                destino = urllib.parse.urlsplit(e.headers.get('Location', '')).path
+                # Voltar para o login fora da própria rota de login significa sessão perdida
+                erro = destino == '/login' and rota != 'POST /login'
+            else:
+                erro = True
+                lock = e.headers.get(CABECALHO_LOCK) == 'lock'
+            e.close()
+        except (urllib.error.URLError, socket.timeout, ConnectionError):
+            erro = True
+        self.metricas.registrar(rota, time.perf_counter() - inicio, erro=erro, lock=lock)
+        return conteudo, destino
+
+    def postar(self, rota, caminho, dados):
+        # Como o navegador, segue para a lista depois do POST, registrada como GET /
+        _, destino = self.requisitar(rota, caminho, dados)
+        if destino == '/':
+            self.listar()
+
+    def login(self):
+        self.postar('POST /login', '/login', {'username': 'admin', 'password': 'admin'})
+
+    def listar(self, filtros=None):
+        caminho = '/'
+        if filtros:
+            caminho += '?' + urllib.parse.urlencode(filtros)
+        conteudo, _ = self.requisitar('GET /', caminho)
+        if conteudo:
+            ids = re.findall(rb'/editar/(\d+)', conteudo)
+            if ids:
+                self.ids_conhecidos = [int(i) for i in ids]
+
+    def filtrar(self):
+        filtros = {}
+        if random.random() < 0.6:
+            filtros['filtro_descricao'] = random.choice(PALAVRAS)[:4]
+        if random.random() < 0.6:
+            filtros['filtro_situacao'] = random.choice(SITUACOES)
+        self.listar(filtros or {'filtro_situacao': random.choice(SITUACOES)})
+
+    def adicionar(self):
+        self.requisitar('GET /adicionar', '/adicionar')
+        prevista = (datetime.now() + timedelta(days=random.randint(1, 30))).strftime('%Y-%m-%d')
+        self.postar('POST /adicionar', '/adicionar', {
+            'descricao': f"{random.choice(PALAVRAS).capitalize()} carga",
+            'data_prevista': prevista,
+        })
+
+    def editar(self):
+        if not self.ids_conhecidos:
+            self.listar()
+            if not self.ids_conhecidos:
+                return
+        id_tarefa = random.choice(self.ids_conhecidos)
+        self.requisitar('GET /editar/<id>', f'/editar/{id_tarefa}')
+        situacao = random.choice(SITUACOES)
+        hoje = datetime.now().strftime('%Y-%m-%d')
+        self.postar('POST /editar/<id>', f'/editar/{id_tarefa}', {
+            'descricao': f"{random.choice(PALAVRAS).capitalize()} editada {id_tarefa}",
+            'data_prevista': hoje,
+            'data_encerramento': hoje if situacao == 'Concluído' else '',
+            'situacao': situacao,
+        })
+
+    def exportar(self):
+        filtros = {}
+        if random.random() < 0.5:
+            filtros['filtro_situacao'] = random.choice(SITUACOES)
+        caminho = '/exportar-pdf'
+        if filtros:
+            caminho += '?' + urllib.parse.urlencode(filtros)
+        self.requisitar('GET /exportar-pdf', caminho)
+
+    def executar(self, fim):
+        self.login()
+        while time.monotonic() < fim:
+            cenario = random.choices(self.cenarios, weights=self.pesos)[0]
+            getattr(self, cenario)()
+            if self.pensar > 0:
+                # Tempo de pensar com distribuição exponencial em torno da média
+                time.sleep(min(random.expovariate(1 / self.pensar), self.pensar * 5))
+
+
+# --- Orquestração ---
+def interpretar_mix(texto):
+    """Converte 'listar=50,editar=10' em dicionário de pesos, validando os cenários."""
+    if not texto:
+        return dict(MIX_PADRAO)
+    mix = {}
+    for parte in texto.split(','):
+        nome, _, peso = parte.partition('=')
+        nome = nome.strip()
+        if nome not in MIX_PADRAO:
+            raise ValueError(f"Cenário desconhecido: {nome}")
+        mix[nome] = float(peso or 1)
+    if not any(p > 0 for p in mix.values()):
+        raise ValueError("A mistura precisa de pelo menos um peso positivo")
+    return mix
+
+
+def aguardar_servidor(base_url, processo, limite=30):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("O servidor terminou antes de ficar disponível")
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).close()
+            return
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    raise RuntimeError("O servidor não respondeu a tempo")
+
+
+def executar_carga(args):
+    mix = interpretar_mix(args.mix)
+    porta = args.porta or porta_livre()
+    base_url = f'http://127.0.0.1:{porta}'
+
+    ambiente = dict(os.environ, ENV=args.env)
+    processo = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--servidor',
+         '--porta', str(porta), '--tarefas', str(args.tarefas)],
+        env=ambiente,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    metricas = Metricas()
+    try:
+        aguardar_servidor(base_url, processo)
+
+        inicio = time.monotonic()
+        fim = inicio + args.duracao
+        usuarios = []
+        for i in range(args.usuarios):
+            usuario = UsuarioVirtual(base_url, metricas, mix, args.pensar, args.timeout)
+            t = threading.Thread(target=usuario.executar, args=(fim,), daemon=True)
+            usuarios.append(t)
+            t.start()
+            # Rampa de subida distribuída pelo intervalo configurado
+            if args.rampa and args.usuarios > 1:
+                time.sleep(args.rampa / args.usuarios)
+
+        while any(t.is_alive() for t in usuarios):
+            rss = ler_rss_kb(processo.pid)
+            if rss is not None:
+                metricas.rss.append((round(time.monotonic() - inicio, 1), rss))
+            time.sleep(args.intervalo_rss)
+        duracao_total = time.monotonic() - inicio
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+    return metricas.relatorio(duracao_total)
+
+
+def imprimir_relatorio(relatorio):
+    print(f"Duração: {relatorio['duracao_s']}s | Requisições: {relatorio['requisicoes']} | "
+          f"Vazão: {relatorio['vazao_rps']} req/s | Erros: {relatorio['taxa_erro']:.2%} | "
+          f"Locks: {relatorio['taxa_lock']:.2%}")
+    print()
+    print(f"{'Rota':<20}{'Req':>7}{'req/s':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'máx':>9}{'erro':>8}{'lock':>8}")
+    for rota, m in relatorio['rotas'].items():
+        print(f"{rota:<20}{m['requisicoes']:>7}{m['vazao_rps']:>8}{m['p50_ms']:>9}{m['p90_ms']:>9}"
+              f"{m['p95_ms']:>9}{m['p99_ms']:>9}{m['max_ms']:>9}{m['taxa_erro']:>8.2%}{m['taxa_lock']:>8.2%}")
+    if relatorio['rss_kb']:
+        print()
+        print("RSS do servidor (s -> MB):")
+        for segundos, kb in relatorio['rss_kb']:
+            print(f"  {segundos:>7}s  {kb / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga local do sistema de tarefas")
+    parser.add_argument('--usuarios', type=int, default=10, help="usuários virtuais concorrentes")
+    parser.add_argument('--duracao', type=float, default=30, help="duração do teste em segundos")
+    parser.add_argument('--rampa', type=float, default=0, help="segundos para subir todos os usuários")
+    parser.add_argument('--pensar', type=float, default=1.0, help="tempo médio de pensar entre ações (s)")
+    parser.add_argument('--mix', help="pesos dos cenários, ex.: listar=50,editar=10 "
+                                      f"(cenários: {', '.join(MIX_PADRAO)})")
+    parser.add_argument('--tarefas', type=int, default=1000, help="tarefas no banco semeado")
+    parser.add_argument('--env', default='carga', help="ambiente do banco (tarefas_{env}.db)")
+    parser.add_argument('--porta', type=int, default=0, help="porta do servidor (0 = livre)")
+    parser.add_argument('--timeout', type=float, default=30, help="timeout por requisição (s)")
+    parser.add_argument('--intervalo-rss', type=float, default=1.0, help="intervalo de amostragem do RSS (s)")
+    parser.add_argument('--json', help="salva o relatório completo neste arquivo")
+    parser.add_argument('--servidor', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.servidor:
+        executar_servidor(args.porta, args.tarefas)
+        return
+
+    relatorio = executar_carga(args)
+    imprimir_relatorio(relatorio)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# manutencao.py
+# Manutenção periódica do banco SQLite: estatísticas do planejador,
+# checkpoint do WAL e vacuum incremental, cada uma com prazo máximo
+# para não segurar locks enquanto o app atende requisições.
+#
+# Uso pela linha de comando (mesmo banco do app, definido por ENV):
+#   ENV=local python manutencao.py              # executa todas as tarefas
+#   ENV=local python manutencao.py vacuum       # executa só as tarefas indicadas
+#   ENV=local python manutencao.py --status     # mostra o estado do banco
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Quantas instruções da VM do SQLite entre cada verificação de prazo
+PASSOS_VERIFICACAO_PRAZO = 1000
+# Páginas liberadas por lote no vacuum incremental
+PAGINAS_POR_LOTE = 256
+
+
+class PrazoEsgotado(Exception):
+    pass
+
+
+@contextmanager
+def prazo(conn, segundos):
+    # O progress handler interrompe a instrução em andamento quando o prazo
+    # acaba; o SQLite desfaz a operação e levanta OperationalError
+    fim = time.monotonic() + segundos
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > fim else 0, PASSOS_VERIFICACAO_PRAZO)
+    try:
+        yield fim
+    except sqlite3.OperationalError as e:
+        if 'interrupt' in str(e):
+            raise PrazoEsgotado(f"prazo de {segundos}s esgotado") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def configurar_auto_vacuum(conn):
+    # auto_vacuum só pode mudar em banco vazio ou seguido de um VACUUM completo;
+    # isso acontece uma única vez, na inicialização do banco
+    modo = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if modo == 2:
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+
+def otimizar(conn, segundos):
+    # ANALYZE a cada execução: o PRAGMA optimize das versões do SQLite anteriores
+    # à 3.46 só reanalisa tabelas já consultadas pela própria conexão, e a do
+    # agendador é sempre nova. analysis_limit amostra no máximo ~400 linhas por
+    # índice, o que mantém o custo baixo mesmo em tabelas grandes.
+    with prazo(conn, segundos):
+        conn.execute('PRAGMA analysis_limit = 400')
+        conn.execute('ANALYZE')
+        conn.commit()
+    return {'tabelas_analisadas': conn.execute('SELECT COUNT(DISTINCT tbl) FROM sqlite_stat1').fetchone()[0]}
+
+
+def checkpoint_wal(conn, segundos):
+    modo = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    if modo.lower() != 'wal':
+        return {'journal_mode': modo, 'executado': False}
+    # TRUNCATE espera leitores pelo busy_timeout; limitado ao prazo da tarefa
+    conn.execute(f'PRAGMA busy_timeout = {int(segundos * 1000)}')
+    with prazo(conn, segundos):
+        ocupado, paginas_wal, paginas_copiadas = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    return {
+        'journal_mode': modo,
+        'executado': True,
+        'ocupado': bool(ocupado),
+        'paginas_wal': paginas_wal,
+        'paginas_copiadas': paginas_copiadas,
+    }
+
+
+def vacuum_incremental(conn, segundos):
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return {'executado': False, 'motivo': 'auto_vacuum diferente de INCREMENTAL'}
+    fim = time.monotonic() + segundos
+    liberadas = 0
+    # Lotes pequenos: cada um é uma transação curta, e o prazo é checado entre eles
+    while time.monotonic() < fim:
+        livres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if livres == 0:
+            break
+        lote = min(livres, PAGINAS_POR_LOTE)
+        try:
+            with prazo(conn, max(fim - time.monotonic(), 0)):
+                conn.execute(f'PRAGMA incremental_vacuum({lote})').fetchall()
+        except PrazoEsgotado:
+            break
+        liberadas += lote
+    return {
+        'executado': True,
+        'paginas_liberadas': liberadas,
+        'paginas_livres_restantes': conn.execute('PRAGMA freelist_count').fetchone()[0],
+    }
+
+
+def estatisticas_banco(conn, db_filename):
+    paginas = conn.execute('PRAGMA page_count').fetchone()[0]
+    livres = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    tamanho_wal = os.path.getsize(db_filename + '-wal') if os.path.exists(db_filename + '-wal') else 0
+    return {
+        'arquivo': db_filename,
+        'tamanho_bytes': os.path.getsize(db_filename) if os.path.exists(db_filename) else 0,
+        'tamanho_wal_bytes': tamanho_wal,
+        'tamanho_pagina': conn.execute('PRAGMA page_size').fetchone()[0],
+        'paginas': paginas,
+        'paginas_livres': livres,
+        'proporcao_livre': round(livres / paginas, 4) if paginas else 0,
+        'journal_mode': conn.execute('PRAGMA journal_mode').fetchone()[0],
+        'auto_vacuum': {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}[conn.execute('PRAGMA auto_vacuum').fetchone()[0]],
+    }
+
+
+class AgendadorManutencao:
+    # Executa as tarefas registradas em uma thread de fundo, cada uma no seu
+    # intervalo, com conexão própria; guarda o resultado da última execução
+
+    def __init__(self, db_filename, intervalo_verificacao=30, logger=None):
+        self.db_filename = db_filename
+        self.intervalo_verificacao = intervalo_verificacao
+        self.logger = logger
+        self._tarefas = {}
+        self._lock = threading.Lock()
+        self._execucao = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def registrar(self, nome, funcao, intervalo_segundos, prazo_segundos):
+        self._tarefas[nome] = {
+            'funcao': funcao,
+            'intervalo_segundos': intervalo_segundos,
+            'prazo_segundos': prazo_segundos,
+            'ultima_execucao': None,
+            'proxima_execucao': time.time() + intervalo_segundos,
+            'duracao_ms': None,
+            'resultado': None,
+            'erro': None,
+        }
+
+    def nomes_tarefas(self):
+        return list(self._tarefas)
+
+    def conectar(self):
+        return sqlite3.connect(self.db_filename, timeout=1)
+
+    def executar(self, nome):
+        tarefa = self._tarefas[nome]
+        # Uma tarefa por vez, seja pela thread ou pela linha de comando
+        with self._execucao:
+            inicio = time.monotonic()
+            resultado, erro = None, None
+            conn = None
+            try:
+                conn = self.conectar()
+                resultado = tarefa['funcao'](conn, tarefa['prazo_segundos'])
+            except (PrazoEsgotado, sqlite3.Error) as e:
+                erro = str(e)
+                if self.logger:
+                    self.logger.warning('Manutenção %s falhou: %s', nome, e)
+            except Exception as e:
+                # Falha inesperada de uma tarefa não pode derrubar a thread de manutenção
+                erro = f"{type(e).__name__}: {e}"
+                if self.logger:
+                    self.logger.exception('Manutenção %s falhou', nome)
+            finally:
+                if conn is not None:
+                    conn.close()
+            with self._lock:
+                tarefa['ultima_execucao'] = datetime.now().isoformat(timespec='seconds')
+                tarefa['proxima_execucao'] = time.time() + tarefa['intervalo_segundos']
+                tarefa['duracao_ms'] = round((time.monotonic() - inicio) * 1000, 1)
+                tarefa['resultado'] = resultado
+                tarefa['erro'] = erro
+        return resultado, erro
+
+    def executar_pendentes(self):
+        agora = time.time()
+        for nome, tarefa in list(self._tarefas.items()):
+            if tarefa['proxima_execucao'] <= agora:
+                try:
+                    self.executar(nome)
+                except Exception:
+                    # Última proteção da thread: registra e segue para a próxima tarefa
+                    if self.logger:
+                        self.logger.exception('Manutenção %s falhou', nome)
+
+    def iniciar(self):
+        if self._thread is not None:
+            return self._thread
+        self._parar.clear()
+
+        def laco():
+            while not self._parar.wait(self.intervalo_verificacao):
+                self.executar_pendentes()
+
+        self._thread = threading.Thread(target=laco, name='manutencao-banco', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def status(self):
+        conn = self.conectar()
+        try:
+            banco = estatisticas_banco(conn, self.db_filename)
+        finally:
+            conn.close()
+        with self._lock:
+            tarefas = {
+                nome: {
+                    'intervalo_segundos': t['intervalo_segundos'],
+                    'prazo_segundos': t['prazo_segundos'],
+                    'ultima_execucao': t['ultima_execucao'],
+                    'proxima_execucao': datetime.fromtimestamp(t['proxima_execucao']).isoformat(timespec='seconds'),
+                    'duracao_ms': t['duracao_ms'],
+                    'resultado': t['resultado'],
+                    'erro': t['erro'],
+                }
+                for nome, t in self._tarefas.items()
+            }
+        return {'banco': banco, 'tarefas': tarefas, 'ativo': self._thread is not None and self._thread.is_alive()}
+
+
+if __name__ == '__main__':
+    # Usa o agendador configurado pelo app (inclui a compactação do feed de alterações)
+    from app import agendador_manutencao
+
+    argumentos = sys.argv[1:]
+    if argumentos == ['--status']:
+        print(json.dumps(agendador_manutencao.status(), ensure_ascii=False, indent=2))
+        sys.exit(0)
+    falhou = False
+    disponiveis = agendador_manutencao.nomes_tarefas()
+    for nome in argumentos or disponiveis:
+        if nome not in disponiveis:
+            print(f"Tarefa desconhecida: {nome} (disponíveis: {', '.join(disponiveis)})")
+            sys.exit(2)
+        resultado, erro = agendador_manutencao.executar(nome)
+        print(f"{nome}: {erro or json.dumps(resultado, ensure_ascii=False)}")
+        falhou = falhou or erro is not None
+    sys.exit(1 if falhou else 0)
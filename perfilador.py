@@ -0,0 +1,262 @@
+# perfilador.py
+# Perfilamento sob demanda de requisições em produção. Liga e desliga em
+# tempo de execução (sem reiniciar), por taxa de amostragem ou por rota.
+# Cada requisição capturada guarda as funções mais custosas e os SQL
+# executados num anel limitado de arquivos em disco: ao chegar na
+# capacidade, a captura mais antiga é sobrescrita.
+#
+# Modos:
+#   amostragem  lê a pilha da thread da requisição a cada intervalo; baixo custo
+#   cprofile    cProfile completo, salvo também em .pstats (python -m pstats arquivo).
+#               A partir do Python 3.12 o cProfile usa sys.monitoring, que vale para
+#               todas as threads: a captura inclui as funções das requisições
+#               concorrentes e o custo do perfil recai sobre todas elas.
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+MODOS = ('amostragem', 'cprofile')
+# Escopo efetivo do modo cprofile nesta versão do Python
+CPROFILE_POR_PROCESSO = sys.version_info >= (3, 12)
+# Limites por captura, para o registro não crescer com requisições grandes
+MAXIMO_FUNCOES = 25
+MAXIMO_SQL = 200
+# O trace callback do sqlite3 recebe a instrução com os parâmetros já
+# substituídos; literais de texto, blob e número voltam a ser '?' para que
+# senhas e dados das tarefas não sejam gravados em disco
+LITERAIS_SQL = re.compile(r"[xX]?'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+
+
+def nome_funcao(arquivo, linha, funcao):
+    return f"{os.path.basename(arquivo)}:{linha}({funcao})"
+
+
+def sem_valores(instrucao):
+    return LITERAIS_SQL.sub('?', ' '.join(instrucao.split()))
+
+
+class Captura:
+
+    def __init__(self, endpoint, metodo, caminho, modo, intervalo_amostragem):
+        self.endpoint = endpoint
+        self.metodo = metodo
+        self.caminho = caminho
+        self.modo = modo
+        self.intervalo_amostragem = intervalo_amostragem
+        self.sql = []
+        self.total_sql = 0
+        self.perfil = None
+        self.amostras = 0
+        self._proprias = Counter()
+        self._acumuladas = Counter()
+        self._parar = threading.Event()
+        self._amostrador = None
+        self._inicio = None
+        self.data_inicio = None
+
+    def registrar_sql(self, instrucao):
+        # Usado como trace callback da conexão sqlite3 da requisição
+        self.total_sql += 1
+        if len(self.sql) < MAXIMO_SQL:
+            self.sql.append(sem_valores(instrucao))
+
+    def iniciar(self):
+        self.data_inicio = datetime.now().isoformat(timespec='seconds')
+        self._inicio = time.perf_counter()
+        if self.modo == 'cprofile':
+            self.perfil = cProfile.Profile()
+            self.perfil.enable()
+        else:
+            thread_id = threading.get_ident()
+            self._amostrador = threading.Thread(target=self._amostrar, args=(thread_id,),
+                                                name='perfilador-amostragem', daemon=True)
+            self._amostrador.start()
+
+    def _amostrar(self, thread_id):
+        while not self._parar.wait(self.intervalo_amostragem):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            self.amostras += 1
+            self._proprias[nome_funcao(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)] += 1
+            vistas = set()
+            while frame is not None:
+                chave = nome_funcao(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)
+                if chave not in vistas:
+                    vistas.add(chave)
+                    self._acumuladas[chave] += 1
+                frame = frame.f_back
+
+    def finalizar(self, status):
+        duracao = time.perf_counter() - self._inicio
+        if self.perfil is not None:
+            self.perfil.disable()
+            funcoes = self._funcoes_cprofile()
+        else:
+            self._parar.set()
+            self._amostrador.join()
+            funcoes = self._funcoes_amostragem()
+        return {
+            'endpoint': self.endpoint,
+            'metodo': self.metodo,
+            'caminho': self.caminho,
+            'status': status,
+            'inicio': self.data_inicio,
+            'duracao_ms': round(duracao * 1000, 1),
+            'modo': self.modo,
+            'escopo': 'processo' if self.perfil is not None and CPROFILE_POR_PROCESSO else 'thread',
+            'amostras': self.amostras if self.perfil is None else None,
+            'funcoes': funcoes,
+            'total_sql': self.total_sql,
+            'sql': self.sql,
+        }
+
+    def _funcoes_cprofile(self):
+        estatisticas = pstats.Stats(self.perfil).stats
+        funcoes = [
+            {
+                'funcao': nome_funcao(*chave),
+                'chamadas': chamadas,
+                'tempo_proprio_ms': round(proprio * 1000, 2),
+                'tempo_total_ms': round(total * 1000, 2),
+            }
+            for chave, (_, chamadas, proprio, total, _) in estatisticas.items()
+        ]
+        funcoes.sort(key=lambda f: f['tempo_proprio_ms'], reverse=True)
+        return funcoes[:MAXIMO_FUNCOES]
+
+    def _funcoes_amostragem(self):
+        intervalo_ms = self.intervalo_amostragem * 1000
+        mais_frequentes = sorted(self._acumuladas,
+                                 key=lambda f: (self._proprias[f], self._acumuladas[f]), reverse=True)
+        return [
+            {
+                'funcao': funcao,
+                'chamadas': None,
+                'tempo_proprio_ms': round(self._proprias[funcao] * intervalo_ms, 2),
+                'tempo_total_ms': round(self._acumuladas[funcao] * intervalo_ms, 2),
+            }
+            for funcao in mais_frequentes[:MAXIMO_FUNCOES]
+        ]
+
+
+class Perfilador:
+
+    def __init__(self, diretorio, capacidade=50, intervalo_amostragem=0.005):
+        self.diretorio = diretorio
+        self.capacidade = capacidade
+        self.intervalo_amostragem = intervalo_amostragem
+        self._lock = threading.Lock()
+        # cProfile não suporta dois perfis ativos ao mesmo tempo a partir do Python 3.12;
+        # requisições concorrentes caem para o modo de amostragem
+        self._cprofile_em_uso = threading.Lock()
+        self._config = {'ativo': False, 'taxa': 0.0, 'rotas': [], 'modo': 'amostragem', 'limiar_ms': 0}
+        self._seq = self._ultimo_seq()
+
+    def _arquivo(self, seq, extensao):
+        return os.path.join(self.diretorio, f"perfil_{seq % self.capacidade:03d}.{extensao}")
+
+    def _ultimo_seq(self):
+        # Retoma a numeração do anel a partir das capturas já gravadas
+        ultimo = 0
+        for registro in self._ler_registros():
+            ultimo = max(ultimo, registro['seq'])
+        return ultimo
+
+    def configurar(self, ativo=None, taxa=None, rotas=None, modo=None, limiar_ms=None):
+        # Valida tudo antes de aplicar, para não deixar a configuração pela metade
+        novos = {}
+        if ativo is not None:
+            novos['ativo'] = bool(ativo)
+        if taxa is not None:
+            novos['taxa'] = min(max(float(taxa), 0.0), 1.0)
+        if rotas is not None:
+            novos['rotas'] = [r for r in rotas if r]
+        if modo is not None:
+            if modo not in MODOS:
+                raise ValueError(f"Modo de perfilamento desconhecido: {modo}")
+            novos['modo'] = modo
+        if limiar_ms is not None:
+            novos['limiar_ms'] = max(float(limiar_ms), 0.0)
+        with self._lock:
+            self._config = dict(self._config, **novos)
+
+    def configuracao(self):
+        with self._lock:
+            return dict(self._config, rotas=list(self._config['rotas']))
+
+    def deve_perfilar(self, endpoint):
+        config = self._config
+        if not config['ativo'] or not endpoint:
+            return False
+        if endpoint in config['rotas']:
+            return True
+        return random.random() < config['taxa']
+
+    def iniciar_captura(self, endpoint, metodo, caminho):
+        modo = self._config['modo']
+        if modo == 'cprofile' and not self._cprofile_em_uso.acquire(blocking=False):
+            modo = 'amostragem'
+        captura = Captura(endpoint, metodo, caminho, modo, self.intervalo_amostragem)
+        try:
+            captura.iniciar()
+        except ValueError:
+            # Outra ferramenta de perfil (debugger, coverage) já está ativa no processo
+            self._cprofile_em_uso.release()
+            captura = Captura(endpoint, metodo, caminho, 'amostragem', self.intervalo_amostragem)
+            captura.iniciar()
+        return captura
+
+    def finalizar_captura(self, captura, status):
+        try:
+            registro = captura.finalizar(status)
+        finally:
+            if captura.modo == 'cprofile':
+                self._cprofile_em_uso.release()
+        if registro['duracao_ms'] < self._config['limiar_ms']:
+            return None
+        with self._lock:
+            self._seq += 1
+            registro['seq'] = self._seq
+        self._gravar(registro, captura.perfil)
+        return registro
+
+    def _gravar(self, registro, perfil):
+        os.makedirs(self.diretorio, exist_ok=True)
+        caminho = self._arquivo(registro['seq'], 'json')
+        temporario = caminho + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(registro, f, ensure_ascii=False)
+        os.replace(temporario, caminho)
+        # O .pstats do slot só vale para a captura atual; remove o de uma captura anterior
+        caminho_pstats = self._arquivo(registro['seq'], 'pstats')
+        if perfil is not None:
+            perfil.dump_stats(caminho_pstats)
+        elif os.path.exists(caminho_pstats):
+            os.remove(caminho_pstats)
+
+    def _ler_registros(self):
+        if not os.path.isdir(self.diretorio):
+            return []
+        registros = []
+        for nome in os.listdir(self.diretorio):
+            if not (nome.startswith('perfil_') and nome.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.diretorio, nome), encoding='utf-8') as f:
+                    registros.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return registros
+
+    def mais_lentas(self, limite=20):
+        registros = sorted(self._ler_registros(), key=lambda r: r['duracao_ms'], reverse=True)
+        return registros[:limite]
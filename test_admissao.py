@@ -0,0 +1,58 @@
+# test_admissao.py
+import threading
+import time
+from admissao import ControleAdmissao
+
+
+# 1. Testar limite por rota e recusa imediata sem fila
+def test_1_limite_por_rota_sem_fila():
+    controle = ControleAdmissao(capacidade=10)
+    controle.configurar_rota('exportar_pdf', peso=1, limite=2, fila=0)
+    assert controle.entrar('exportar_pdf')
+    assert controle.entrar('exportar_pdf')
+    assert not controle.entrar('exportar_pdf')
+    rota = controle.status()['rotas']['exportar_pdf']
+    assert rota['em_execucao'] == 2
+    assert rota['rejeitadas'] == 1
+
+# 2. Testar que o peso consome a capacidade compartilhada entre rotas
+def test_2_peso_consome_capacidade_compartilhada():
+    controle = ControleAdmissao(capacidade=4)
+    controle.configurar_rota('exportar_pdf', peso=3)
+    controle.configurar_rota('listar_tarefas', peso=1)
+    assert controle.entrar('exportar_pdf')
+    assert controle.entrar('listar_tarefas')
+    assert not controle.entrar('listar_tarefas')
+    controle.sair('exportar_pdf')
+    assert controle.entrar('listar_tarefas')
+    assert controle.status()['em_uso'] == 2
+
+# 3. Testar que a fila espera uma vaga e expira após a espera máxima
+def test_3_fila_espera_e_expira():
+    controle = ControleAdmissao(capacidade=1)
+    controle.configurar_rota('exportar_pdf', fila=1, espera=2)
+    assert controle.entrar('exportar_pdf')
+    threading.Timer(0.1, controle.sair, args=('exportar_pdf',)).start()
+    inicio = time.monotonic()
+    assert controle.entrar('exportar_pdf') # Admitida quando a primeira sai
+    assert time.monotonic() - inicio < 1.5
+    controle.sair('exportar_pdf')
+
+    controle.configurar_rota('exportar_pdf', fila=1, espera=0.1)
+    assert controle.entrar('exportar_pdf')
+    assert not controle.entrar('exportar_pdf')
+    assert controle.status()['rotas']['exportar_pdf']['expiradas'] == 1
+
+# 4. Testar que a fila cheia recusa sem esperar
+def test_4_fila_cheia_recusa():
+    controle = ControleAdmissao(capacidade=1)
+    controle.configurar_rota('exportar_pdf', fila=1, espera=1)
+    assert controle.entrar('exportar_pdf')
+    esperando = threading.Thread(target=controle.entrar, args=('exportar_pdf',))
+    esperando.start()
+    while controle.status()['rotas']['exportar_pdf']['na_fila'] == 0:
+        time.sleep(0.01)
+    inicio = time.monotonic()
+    assert not controle.entrar('exportar_pdf')
+    assert time.monotonic() - inicio < 0.5
+    esperando.join()
@@ -2,16 +2,26 @@
 import pytest
 import sqlite3
 import io # Pode ser útil para testes de PDF, mas vamos focar no CRUD por enquanto
-from app import app # Importa a instância do seu app Flask
+from app import app, criar_indices_tarefas, criar_rastreamento_alteracoes, compactar_alteracoes, compactar_alteracoes_com_prazo # Importa a instância do seu app Flask
 # Importa as funções do banco de dados, vamos adaptá-las para usar a conexão em memória
 from database import criar_tabela_usuarios, adicionar_usuario_inicial, criar_tabela_tarefas, popular_tabela_tarefas
 
 
+# Conexão em memória compartilhada entre as requisições do teste: o teardown
+# do app chama close() a cada requisição, o que apagaria o banco em memória
+class ConexaoCompartilhada(sqlite3.Connection):
+    def close(self):
+        pass
+
+    def fechar(self):
+        super().close()
+
+
 # Fixture que configura o cliente de teste e o banco de dados em memória
 @pytest.fixture
 def client():
     # Usa um banco de dados SQLite em memória para testes
-    db_conn = sqlite3.connect(':memory:')
+    db_conn = sqlite3.connect(':memory:', factory=ConexaoCompartilhada)
 
     # Cria um cursor para executar comandos SQL no banco de dados em memória
     cursor = db_conn.cursor()
@@ -47,6 +57,8 @@ def client():
                 situacao TEXT NOT NULL
             )
         ''')
+        criar_indices_tarefas(cursor)
+        criar_rastreamento_alteracoes(cursor)
         db_conn.commit()
 
     def popular_tabela_tarefas_test():
@@ -70,7 +82,7 @@ def client():
     # Isso é uma abordagem simples para este caso. Em projetos maiores,
     # pode ser melhor usar padrões como injeção de dependência ou ORMs.
     original_connect = sqlite3.connect
-    sqlite3.connect = lambda db_name: db_conn
+    sqlite3.connect = lambda *args, **kwargs: db_conn
 
     # Configura o app Flask para modo de teste e define uma chave secreta
     app.config['TESTING'] = True
@@ -85,10 +97,11 @@ def client():
 
     # Cria o cliente de teste do Flask
     with app.test_client() as client:
+        client.db_conn = db_conn # Acesso direto ao banco em memória para os testes
         yield client # Fornece o cliente de teste para as funções de teste
 
     # Após o teste, fecha a conexão com o banco em memória e restaura a função original de connect
-    db_conn.close()
+    db_conn.fechar()
     sqlite3.connect = original_connect
 
 
@@ -300,4 +313,304 @@ def test_20_deleted_task_is_not_in_list(client):
     # Agora faz um GET na lista para verificar se a tarefa sumiu
     response = client.get('/')
     assert response.status_code == 200
-    assert b'Tarefa 2' not in response.data # Verifica se a descri\xc3\xa7\xc3\xa3o n\xc3\xa3o aparece na p\xc3\xa1gina
\ No newline at end of file
+    assert b'Tarefa 2' not in response.data # Verifica se a descri\xc3\xa7\xc3\xa3o n\xc3\xa3o aparece na p\xc3\xa1gina
+
+
+# Testes de Filtros por Período e Atrasadas
+
+# 21. Testar filtro por intervalo de data prevista (limites inclusivos)
+def test_21_filter_by_expected_date_range(client):
+    login(client, 'admin', 'senha123')
+    response = client.get('/?prevista_de=2024-01-06&prevista_ate=2024-01-07')
+    assert response.status_code == 200
+    assert b'Tarefa 1' not in response.data
+    assert b'Tarefa 2' in response.data
+    assert b'Tarefa 3' in response.data
+
+# 22. Testar filtro por data de encerramento e por data de criação
+def test_22_filter_by_closing_and_creation_date(client):
+    login(client, 'admin', 'senha123')
+    response = client.get('/?encerramento_de=2024-01-01')
+    assert b'Tarefa 3' in response.data
+    assert b'Tarefa 1' not in response.data
+    response = client.get('/?criacao_ate=2024-01-01')
+    assert b'Tarefa 1' in response.data
+    assert b'Tarefa 2' in response.data
+    assert b'Tarefa 3' not in response.data
+
+# 23. Testar que datas inválidas são ignoradas em vez de gerar erro
+def test_23_invalid_date_filter_is_ignored(client):
+    login(client, 'admin', 'senha123')
+    response = client.get('/?prevista_de=31/12/2024')
+    assert response.status_code == 200
+    assert b'Tarefa 1' in response.data
+    assert b'Tarefa 3' in response.data
+
+# 24. Testar filtro de atrasadas: prazo vencido e ainda não encerrada
+def test_24_overdue_filter(client):
+    login(client, 'admin', 'senha123')
+    client.post('/adicionar', data={'descricao': 'Tarefa Futura', 'data_prevista': '2999-01-01'})
+    response = client.get('/?atrasadas=1')
+    assert b'Tarefa 1' in response.data
+    assert b'Tarefa 2' in response.data
+    assert b'Tarefa 3' not in response.data # Encerrada
+    assert b'Tarefa Futura' not in response.data # Dentro do prazo
+
+# Plano de execução de cada consulta feita em tarefas durante uma requisição
+def planos_consultas(client, url):
+    db_conn = client.db_conn
+    consultas = []
+    db_conn.set_trace_callback(consultas.append)
+    try:
+        client.get(url)
+    finally:
+        db_conn.set_trace_callback(None)
+    planos = []
+    for sql in consultas:
+        if sql.startswith('SELECT * FROM tarefas WHERE'):
+            planos.extend(linha[3] for linha in db_conn.execute('EXPLAIN QUERY PLAN ' + sql))
+    return planos
+
+# 24b. Testar que os filtros de período e de atrasadas usam índices em vez de varrer a tabela
+@pytest.mark.parametrize('url, indice', [
+    ('/?criacao_de=2024-01-01', 'idx_tarefas_data_criacao'),
+    ('/?prevista_de=2024-01-01', 'idx_tarefas_data_prevista'),
+    ('/?encerramento_de=2024-01-01', 'idx_tarefas_encerradas'),
+    ('/?encerramento_ate=2024-01-31', 'idx_tarefas_encerradas'),
+    ('/?atrasadas=1', 'idx_tarefas_abertas_prevista'),
+])
+def test_24b_date_filters_use_indexes(client, url, indice):
+    login(client, 'admin', 'senha123')
+    planos = planos_consultas(client, url)
+    assert planos
+    assert all(f'USING INDEX {indice}' in plano for plano in planos), planos
+
+# 25. Testar que o PDF aceita os mesmos filtros da listagem
+def test_25_pdf_export_with_date_filters(client):
+    login(client, 'admin', 'senha123')
+    response = client.get('/exportar-pdf?atrasadas=1&prevista_ate=2024-01-05')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+
+
+# Testes do Feed de Alterações (/changes)
+
+# 26. Testar que since=0 retorna a alteração mais recente de cada tarefa
+def test_26_changes_since_zero_returns_all_tasks(client):
+    login(client, 'admin', 'senha123')
+    response = client.get('/changes?since=0')
+    assert response.status_code == 200
+    dados = response.get_json()
+    assert [a['tarefa_id'] for a in dados['alteracoes']] == [1, 2, 3]
+    assert dados['alteracoes'][0]['tarefa']['descricao'] == 'Tarefa 1'
+    assert dados['cursor'] == dados['alteracoes'][-1]['seq']
+    assert dados['mais'] is False
+
+# 26b. Testar que tarefas anteriores ao rastreamento entram no feed uma única vez
+def test_26b_changes_backfills_tasks_created_before_tracking(client):
+    cursor = client.db_conn.cursor()
+    for gatilho in ('trg_tarefas_insercao', 'trg_tarefas_atualizacao', 'trg_tarefas_exclusao'):
+        cursor.execute(f'DROP TRIGGER {gatilho}')
+    for tabela in ('alteracoes_tarefas', 'tarefas_excluidas', 'sincronizacao_meta'):
+        cursor.execute(f'DROP TABLE {tabela}')
+    cursor.execute("INSERT INTO tarefas (descricao, data_criacao, situacao) VALUES ('Tarefa 4', '2024-01-03', 'Pendente')")
+    criar_rastreamento_alteracoes(cursor)
+    criar_rastreamento_alteracoes(cursor) # Reexecutar na próxima inicialização não duplica
+    client.db_conn.commit()
+    login(client, 'admin', 'senha123')
+    dados = client.get('/changes?since=0').get_json()
+    assert [(a['tarefa_id'], a['operacao']) for a in dados['alteracoes']] == [
+        (1, 'insercao'), (2, 'insercao'), (3, 'insercao'), (4, 'insercao')]
+    assert dados['alteracoes'][3]['tarefa']['descricao'] == 'Tarefa 4'
+
+# 27. Testar que o cursor retorna só os deltas, incluindo exclusões
+def test_27_changes_since_cursor_returns_only_deltas(client):
+    login(client, 'admin', 'senha123')
+    cursor = client.get('/changes?since=0').get_json()['cursor']
+    client.post('/editar/1', data={'descricao': 'Tarefa 1 Nova', 'data_prevista': '2024-01-05', 'situacao': 'Pendente'})
+    client.post('/editar/1', data={'descricao': 'Tarefa 1 Final', 'data_prevista': '2024-01-05', 'situacao': 'Pendente'})
+    client.post('/excluir/2')
+    dados = client.get(f'/changes?since={cursor}').get_json()
+    assert [(a['tarefa_id'], a['operacao']) for a in dados['alteracoes']] == [(1, 'atualizacao'), (2, 'exclusao')]
+    assert dados['alteracoes'][0]['tarefa']['descricao'] == 'Tarefa 1 Final'
+    assert dados['alteracoes'][1]['tarefa'] is None
+    assert client.get(f"/changes?since={dados['cursor']}").get_json()['alteracoes'] == []
+
+# 28. Testar paginação com limite
+def test_28_changes_pagination(client):
+    login(client, 'admin', 'senha123')
+    dados = client.get('/changes?since=0&limite=2').get_json()
+    assert len(dados['alteracoes']) == 2
+    assert dados['mais'] is True
+    dados = client.get(f"/changes?since={dados['cursor']}&limite=2").get_json()
+    assert [a['tarefa_id'] for a in dados['alteracoes']] == [3]
+
+# 29. Testar compactação: entradas substituídas somem e lápides expiradas geram 410
+def test_29_changes_compaction_and_expired_cursor(client):
+    login(client, 'admin', 'senha123')
+    client.post('/editar/1', data={'descricao': 'Tarefa 1 Nova', 'data_prevista': '2024-01-05', 'situacao': 'Pendente'})
+    client.post('/excluir/2')
+    db_conn = client.db_conn
+    db_conn.execute("UPDATE tarefas_excluidas SET data_exclusao = '2000-01-01 00:00:00'")
+    assert compactar_alteracoes(db_conn, retencao_dias=30) == 3 # insercao da 1, insercao e exclusao da 2
+    dados = client.get('/changes?since=0').get_json()
+    assert [a['tarefa_id'] for a in dados['alteracoes']] == [3, 1]
+    response = client.get('/changes?since=1')
+    assert response.status_code == 410
+
+# 29b. Testar que a compactação agendada respeita o prazo e desfaz o trabalho ao estourar
+def test_29b_scheduled_compaction_is_time_bounded(client):
+    import manutencao
+    db_conn = client.db_conn
+    db_conn.executemany("INSERT INTO alteracoes_tarefas (tarefa_id, operacao) VALUES (?, 'atualizacao')",
+                        [(i % 500,) for i in range(50000)])
+    db_conn.commit()
+    total = db_conn.execute('SELECT COUNT(*) FROM alteracoes_tarefas').fetchone()[0]
+    with pytest.raises(manutencao.PrazoEsgotado):
+        compactar_alteracoes_com_prazo(db_conn, 0)
+    db_conn.rollback()
+    assert db_conn.execute('SELECT COUNT(*) FROM alteracoes_tarefas').fetchone()[0] == total
+    assert compactar_alteracoes_com_prazo(db_conn, 30)['removidas'] > 0
+
+# 30. Testar que o stream SSE envia as alterações com id para retomada
+def test_30_changes_stream_sends_events(client):
+    login(client, 'admin', 'senha123')
+    duracao_original = app.config['SSE_DURACAO_MAXIMA']
+    app.config['SSE_DURACAO_MAXIMA'] = 0 # Uma única consulta e o stream termina
+    try:
+        response = client.get('/changes/stream', headers={'Last-Event-ID': '2'})
+        assert response.mimetype == 'text/event-stream'
+        corpo = response.get_data(as_text=True)
+    finally:
+        app.config['SSE_DURACAO_MAXIMA'] = duracao_original
+    assert 'id: 3\nevent: alteracao' in corpo
+    assert 'id: 1\n' not in corpo
+
+# 31. Testar que o status da manutenção lista as tarefas agendadas
+def test_31_maintenance_status(client):
+    login(client, 'admin', 'senha123')
+    dados = client.get('/manutencao/status').get_json()
+    assert set(dados['tarefas']) == {'otimizar', 'checkpoint', 'vacuum', 'compactar_alteracoes'}
+    assert 'proporcao_livre' in dados['banco']
+
+# Testes do Controle de Admissão
+
+# 32. Testar que o PDF recebe 503 com Retry-After quando não há vaga nem fila
+def test_32_pdf_export_is_shed_when_overloaded(client, monkeypatch):
+    import app as app_module
+    from admissao import ControleAdmissao
+    controle = ControleAdmissao(capacidade=4)
+    controle.configurar_rota('exportar_pdf', peso=3, limite=1, fila=0, espera=3)
+    monkeypatch.setattr(app_module, 'controle_admissao', controle)
+    login(client, 'admin', 'senha123')
+    assert controle.entrar('exportar_pdf') # Ocupa a única vaga
+    response = client.get('/exportar-pdf')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert client.get('/').status_code == 200 # Rotas fora do controle seguem atendidas
+    controle.sair('exportar_pdf')
+    assert client.get('/exportar-pdf').status_code == 200
+    assert controle.status()['rotas']['exportar_pdf']['em_execucao'] == 0 # Liberada no teardown
+
+# Testes do Perfilador
+
+# 33. Testar que a rota selecionada é capturada com os SQL executados e aparece na tela do perfilador
+def test_33_profiler_captures_selected_route(client, monkeypatch, tmp_path):
+    import app as app_module
+    from perfilador import Perfilador
+    monkeypatch.setattr(app_module, 'perfilador_requisicoes', Perfilador(str(tmp_path)))
+    login(client, 'admin', 'senha123')
+    client.post('/perfilador', data={'ativo': '1', 'taxa': '0', 'modo': 'cprofile', 'rotas': ['exportar_pdf']})
+    client.get('/') # Fora da rota selecionada, com taxa zero
+    assert client.get('/exportar-pdf?filtro_situacao=Pendente').status_code == 200
+    capturas = app_module.perfilador_requisicoes.mais_lentas()
+    assert [c['endpoint'] for c in capturas] == ['exportar_pdf']
+    assert capturas[0]['status'] == 200
+    assert any('FROM tarefas' in instrucao for instrucao in capturas[0]['sql'])
+    response = client.get('/perfilador')
+    assert response.status_code == 200
+    assert b'/exportar-pdf?filtro_situacao=Pendente' in response.data
+
+# 33b. Testar que a tela avisa quando o cprofile abrange o processo inteiro
+def test_33b_profiler_page_warns_process_wide_cprofile(client, monkeypatch, tmp_path):
+    import app as app_module
+    import perfilador
+    from perfilador import Perfilador
+    monkeypatch.setattr(app_module, 'perfilador_requisicoes', Perfilador(str(tmp_path)))
+    monkeypatch.setattr(perfilador, 'CPROFILE_POR_PROCESSO', True)
+    login(client, 'admin', 'senha123')
+    client.post('/perfilador', data={'ativo': '1', 'taxa': '0', 'modo': 'cprofile', 'rotas': ['listar_tarefas']})
+    client.get('/')
+    response = client.get('/perfilador')
+    assert 'vale para o processo inteiro'.encode() in response.data
+    assert b'processo inteiro</span>' in response.data
+
+# 33c. Testar que o login nunca é capturado e que os SQL gravados não trazem os valores
+def test_33c_profiler_never_stores_credentials(client, monkeypatch, tmp_path):
+    import app as app_module
+    from perfilador import Perfilador
+    monkeypatch.setattr(app_module, 'perfilador_requisicoes', Perfilador(str(tmp_path)))
+    login(client, 'admin', 'senha123')
+    client.post('/perfilador', data={'ativo': '1', 'taxa': '1', 'modo': 'amostragem', 'rotas': ['login']})
+    client.get('/logout')
+    login(client, 'admin', 'senha123')
+    client.get('/?filtro_descricao=segredo')
+    capturas = app_module.perfilador_requisicoes.mais_lentas()
+    assert 'login' not in [c['endpoint'] for c in capturas]
+    assert any('FROM tarefas' in instrucao for c in capturas for instrucao in c['sql'])
+    for arquivo in tmp_path.iterdir():
+        conteudo = arquivo.read_text(encoding='utf-8')
+        assert 'senha123' not in conteudo
+        assert "'%segredo%'" not in conteudo
+    assert b'senha123' not in client.get('/perfilador').data
+
+# 34. Testar que o stream SSE ocupa a vaga enquanto está aberto e a libera ao terminar
+def test_34_sse_stream_holds_admission_slot_while_open(client, monkeypatch):
+    import app as app_module
+    from admissao import ControleAdmissao
+    controle = ControleAdmissao(capacidade=4)
+    controle.configurar_rota('stream_alteracoes', peso=1, limite=1, fila=0, espera=0)
+    monkeypatch.setattr(app_module, 'controle_admissao', controle)
+    monkeypatch.setitem(app.config, 'SSE_INTERVALO_SEGUNDOS', 0.01)
+    login(client, 'admin', 'senha123')
+    response = client.get('/changes/stream', buffered=False)
+    eventos = iter(response.response)
+    assert next(eventos).startswith(b'retry:')
+    assert next(eventos).startswith(b'id: ')
+    assert next(eventos).startswith(b'id: ')
+    assert controle.status()['rotas']['stream_alteracoes']['em_execucao'] == 1
+    assert not controle.entrar('stream_alteracoes') # Limite de 1 stream atingido
+    response.close()
+    assert controle.status()['rotas']['stream_alteracoes']['em_execucao'] == 0
+    assert controle.entrar('stream_alteracoes')
+    response = client.get('/changes/stream')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+# 35. Testar que requisições sem login não ocupam vaga: são apenas redirecionadas
+def test_35_unauthenticated_requests_skip_admission(client, monkeypatch):
+    import app as app_module
+    from admissao import ControleAdmissao
+    controle = ControleAdmissao(capacidade=4)
+    controle.configurar_rota('exportar_pdf', peso=3, limite=1, fila=0, espera=3)
+    monkeypatch.setattr(app_module, 'controle_admissao', controle)
+    assert controle.entrar('exportar_pdf') # Sem vaga para ninguém
+    response = client.get('/exportar-pdf')
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
+    assert controle.status()['rotas']['exportar_pdf']['rejeitadas'] == 0
+
+# 36. Testar que streams SSE abertos não reduzem a capacidade do PDF
+def test_36_open_sse_streams_do_not_reduce_pdf_admission(client, monkeypatch):
+    import app as app_module
+    controle = app_module.criar_controle_admissao()
+    monkeypatch.setattr(app_module, 'controle_admissao', controle)
+    login(client, 'admin', 'senha123')
+    for _ in range(app.config['ADMISSAO_ROTAS']['stream_alteracoes']['limite']):
+        assert controle.entrar('stream_alteracoes')
+    assert controle.status()['em_uso'] == 0
+    assert client.get('/changes/stream').status_code == 503 # Só o limite próprio restringe o stream
+    assert controle.entrar('exportar_pdf')
+    assert client.get('/exportar-pdf').status_code == 200 # Segundo PDF simultâneo ainda cabe
+    assert client.get('/changes?since=0').status_code == 200
+    assert controle.status()['rotas']['exportar_pdf']['rejeitadas'] == 0
@@ -0,0 +1,72 @@
+# test_carga.py
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from carga import percentil, interpretar_mix, Metricas, MIX_PADRAO, UsuarioVirtual
+
+
+# 1. Percentil interpola linearmente entre as amostras ordenadas
+def test_1_percentil_interpola():
+    valores = [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert percentil(valores, 0) == 1.0
+    assert percentil(valores, 50) == 3.0
+    assert percentil(valores, 100) == 5.0
+    assert percentil(valores, 90) == pytest.approx(4.6)
+    assert percentil([], 50) == 0.0
+
+# 2. Mistura vazia usa os pesos padrão; mistura informada é validada
+def test_2_interpretar_mix():
+    assert interpretar_mix(None) == MIX_PADRAO
+    assert interpretar_mix('listar=3,exportar=1') == {'listar': 3.0, 'exportar': 1.0}
+    with pytest.raises(ValueError):
+        interpretar_mix('inexistente=1')
+    with pytest.raises(ValueError):
+        interpretar_mix('listar=0')
+
+# 3. Relatório agrega requisições, erros e locks por rota
+def test_3_relatorio_por_rota():
+    metricas = Metricas()
+    metricas.registrar('GET /', 0.010)
+    metricas.registrar('GET /', 0.030, erro=True, lock=True)
+    metricas.registrar('GET /exportar-pdf', 0.200)
+    relatorio = metricas.relatorio(2.0)
+    assert relatorio['requisicoes'] == 3
+    assert relatorio['vazao_rps'] == 1.5
+    assert relatorio['rotas']['GET /']['taxa_erro'] == 0.5
+    assert relatorio['rotas']['GET /']['taxa_lock'] == 0.5
+    assert relatorio['rotas']['GET /exportar-pdf']['max_ms'] == 200.0
+
+
+# Servidor mínimo: POST redireciona para a lista, GET / devolve uma página
+class ServidorRedirecionamento(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.send_response(302)
+        self.send_header('Location', '/')
+        self.end_headers()
+
+    def do_GET(self):
+        corpo = b'<a href="/editar/7">7</a>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+# 4. Testar que o POST não segue o redirecionamento e a lista é registrada à parte
+def test_4_post_nao_inclui_redirecionamento():
+    servidor = HTTPServer(('127.0.0.1', 0), ServidorRedirecionamento)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    try:
+        metricas = Metricas()
+        usuario = UsuarioVirtual(f'http://127.0.0.1:{servidor.server_port}', metricas, MIX_PADRAO, 0, 5)
+        usuario.postar('POST /adicionar', '/adicionar', {'descricao': 'x'})
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+    assert len(metricas.latencias['POST /adicionar']) == 1
+    assert len(metricas.latencias['GET /']) == 1
+    assert metricas.erros == {}
+    assert usuario.ids_conhecidos == [7]
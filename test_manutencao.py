@@ -0,0 +1,108 @@
+# test_manutencao.py
+import sqlite3
+import time
+import pytest
+import manutencao
+
+
+# Banco em arquivo temporário com auto_vacuum incremental e algumas páginas livres
+@pytest.fixture
+def banco(tmp_path):
+    caminho = str(tmp_path / 'tarefas_teste.db')
+    conn = sqlite3.connect(caminho)
+    manutencao.configurar_auto_vacuum(conn)
+    conn.execute('CREATE TABLE tarefas (id INTEGER PRIMARY KEY, descricao TEXT)')
+    conn.executemany('INSERT INTO tarefas (descricao) VALUES (?)', [('x' * 500,) for _ in range(2000)])
+    conn.commit()
+    conn.execute('DELETE FROM tarefas WHERE id > 100')
+    conn.commit()
+    yield caminho, conn
+    conn.close()
+
+
+# 1. Testar que auto_vacuum passa a INCREMENTAL uma única vez
+def test_1_configurar_auto_vacuum(banco):
+    _, conn = banco
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    assert manutencao.configurar_auto_vacuum(conn) is False
+
+# 2. Testar que o vacuum incremental devolve as páginas livres
+def test_2_vacuum_incremental_libera_paginas(banco):
+    _, conn = banco
+    assert conn.execute('PRAGMA freelist_count').fetchone()[0] > 0
+    resultado = manutencao.vacuum_incremental(conn, 5)
+    assert resultado['executado'] is True
+    assert resultado['paginas_livres_restantes'] == 0
+
+# 3. Testar que as estatísticas do planejador são refeitas a cada execução, numa conexão nova
+def test_3_otimizar_atualiza_estatisticas(banco):
+    caminho, conn = banco
+    conn.execute('CREATE INDEX idx_descricao ON tarefas (descricao)')
+    conn.commit()
+    assert manutencao.otimizar(conn, 5) == {'tabelas_analisadas': 1}
+    antes = conn.execute("SELECT stat FROM sqlite_stat1 WHERE idx = 'idx_descricao'").fetchone()[0]
+    conn.executemany('INSERT INTO tarefas (descricao) VALUES (?)', [(str(i),) for i in range(20000)])
+    conn.commit()
+    nova = sqlite3.connect(caminho) # Como o agendador: conexão sem consultas anteriores
+    try:
+        manutencao.otimizar(nova, 5)
+        depois = nova.execute("SELECT stat FROM sqlite_stat1 WHERE idx = 'idx_descricao'").fetchone()[0]
+    finally:
+        nova.close()
+    assert int(depois.split()[0]) > int(antes.split()[0]) * 10
+
+# 4. Testar que o checkpoint só roda em modo WAL
+def test_4_checkpoint_wal(banco):
+    _, conn = banco
+    assert manutencao.checkpoint_wal(conn, 1)['executado'] is False
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute("INSERT INTO tarefas (descricao) VALUES ('wal')")
+    conn.commit()
+    resultado = manutencao.checkpoint_wal(conn, 1)
+    assert resultado['executado'] is True
+    assert resultado['ocupado'] is False
+
+# 5. Testar que o prazo interrompe instruções longas
+def test_5_prazo_interrompe(banco):
+    _, conn = banco
+    with pytest.raises(manutencao.PrazoEsgotado):
+        with manutencao.prazo(conn, 0):
+            conn.execute('''
+                WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 10000000)
+                SELECT COUNT(*) FROM n
+            ''').fetchone()
+
+# 6. Testar que o agendador registra resultado, erro e estatísticas do banco
+def test_6_agendador_status(banco):
+    caminho, _ = banco
+    agendador = manutencao.AgendadorManutencao(caminho)
+    agendador.registrar('vacuum', manutencao.vacuum_incremental, 60, 5)
+    agendador.registrar('falha', lambda conn, segundos: conn.execute('SELECT * FROM inexistente'), 60, 5)
+    agendador.executar('vacuum')
+    agendador.executar('falha')
+    status = agendador.status()
+    assert status['banco']['auto_vacuum'] == 'INCREMENTAL'
+    assert status['banco']['paginas_livres'] == 0
+    assert status['tarefas']['vacuum']['erro'] is None
+    assert status['tarefas']['vacuum']['ultima_execucao'] is not None
+    assert 'inexistente' in status['tarefas']['falha']['erro']
+
+# 7. Testar que uma exceção inesperada vira erro da tarefa sem derrubar o agendador
+def test_7_excecao_inesperada_nao_derruba_agendador(banco):
+    caminho, _ = banco
+    agendador = manutencao.AgendadorManutencao(caminho, intervalo_verificacao=0.01)
+    def quebrada(conn, segundos):
+        raise KeyError('inesperado')
+    agendador.registrar('quebrada', quebrada, 0, 1)
+    agendador.registrar('vacuum', manutencao.vacuum_incremental, 0, 1)
+    agendador.iniciar()
+    try:
+        fim = time.monotonic() + 5
+        while time.monotonic() < fim and agendador.status()['tarefas']['vacuum']['ultima_execucao'] is None:
+            time.sleep(0.02)
+        assert agendador.status()['ativo'] is True
+    finally:
+        agendador.parar()
+    status = agendador.status()['tarefas']
+    assert 'KeyError' in status['quebrada']['erro']
+    assert status['vacuum']['erro'] is None
@@ -0,0 +1,97 @@
+# test_perfilador.py
+import os
+import time
+import pytest
+from perfilador import Perfilador
+
+
+def trabalho_lento():
+    return sum(i * i for i in range(200000))
+
+
+def capturar(perfilador, endpoint='listar_tarefas', sql=()):
+    captura = perfilador.iniciar_captura(endpoint, 'GET', '/')
+    for instrucao in sql:
+        captura.registrar_sql(instrucao)
+    trabalho_lento()
+    return perfilador.finalizar_captura(captura, 200)
+
+
+# 1. Testar que o perfilador inativo não seleciona requisições
+def test_1_inativo_nao_perfila(tmp_path):
+    perfilador = Perfilador(str(tmp_path))
+    perfilador.configurar(taxa=1)
+    assert not perfilador.deve_perfilar('listar_tarefas')
+    perfilador.configurar(ativo=True, taxa=0, rotas=['exportar_pdf'])
+    assert perfilador.deve_perfilar('exportar_pdf')
+    assert not perfilador.deve_perfilar('listar_tarefas')
+
+# 2. Testar captura em modo cProfile com funções, SQL e arquivo .pstats
+def test_2_captura_cprofile(tmp_path):
+    perfilador = Perfilador(str(tmp_path))
+    perfilador.configurar(ativo=True, modo='cprofile')
+    registro = capturar(perfilador, sql=['SELECT *\n  FROM tarefas'])
+    assert registro['modo'] == 'cprofile'
+    assert registro['sql'] == ['SELECT * FROM tarefas']
+    assert any('trabalho_lento' in f['funcao'] or 'genexpr' in f['funcao'] for f in registro['funcoes'])
+    assert os.path.exists(tmp_path / 'perfil_001.pstats')
+
+# 3. Testar captura por amostragem de pilha
+def test_3_captura_amostragem(tmp_path):
+    perfilador = Perfilador(str(tmp_path), intervalo_amostragem=0.001)
+    perfilador.configurar(ativo=True, modo='amostragem')
+    captura = perfilador.iniciar_captura('exportar_pdf', 'GET', '/exportar-pdf')
+    fim = time.monotonic() + 0.1
+    while time.monotonic() < fim:
+        trabalho_lento()
+    registro = perfilador.finalizar_captura(captura, 200)
+    assert registro['amostras'] > 0
+    assert any('trabalho_lento' in f['funcao'] or 'genexpr' in f['funcao'] for f in registro['funcoes'])
+
+# 4. Testar que o anel em disco é limitado e mantém as capturas mais recentes
+def test_4_anel_limitado(tmp_path):
+    perfilador = Perfilador(str(tmp_path), capacidade=3)
+    perfilador.configurar(ativo=True, modo='cprofile')
+    for _ in range(5):
+        capturar(perfilador)
+    assert len([n for n in os.listdir(tmp_path) if n.endswith('.json')]) == 3
+    assert sorted(r['seq'] for r in perfilador.mais_lentas()) == [3, 4, 5]
+    # A numeração continua após reiniciar o processo
+    assert Perfilador(str(tmp_path), capacidade=3)._seq == 5
+
+# 5. Testar limiar de duração e validação da configuração
+def test_5_limiar_e_validacao(tmp_path):
+    perfilador = Perfilador(str(tmp_path))
+    perfilador.configurar(ativo=True, limiar_ms=60000)
+    assert capturar(perfilador) is None
+    assert perfilador.mais_lentas() == []
+    with pytest.raises(ValueError):
+        perfilador.configurar(ativo=False, modo='inexistente')
+    assert perfilador.configuracao()['ativo'] is True # Nada aplicado quando a validação falha
+
+# 6. Testar que a captura registra o escopo: cprofile é do processo inteiro a partir do 3.12
+def test_6_escopo_da_captura(tmp_path, monkeypatch):
+    import perfilador as modulo
+    perfilador = Perfilador(str(tmp_path))
+    perfilador.configurar(ativo=True, modo='cprofile')
+    monkeypatch.setattr(modulo, 'CPROFILE_POR_PROCESSO', True)
+    assert capturar(perfilador)['escopo'] == 'processo'
+    monkeypatch.setattr(modulo, 'CPROFILE_POR_PROCESSO', False)
+    assert capturar(perfilador)['escopo'] == 'thread'
+    perfilador.configurar(modo='amostragem')
+    monkeypatch.setattr(modulo, 'CPROFILE_POR_PROCESSO', True)
+    assert capturar(perfilador)['escopo'] == 'thread'
+
+# 7. Testar que os SQL são gravados sem os valores substituídos pelo sqlite3
+def test_7_sql_sem_valores(tmp_path):
+    perfilador = Perfilador(str(tmp_path))
+    perfilador.configurar(ativo=True)
+    registro = capturar(perfilador, sql=[
+        "SELECT id FROM usuarios WHERE username = 'admin' AND password = 's3cr''etPW' LIMIT 1",
+        "SELECT * FROM tarefas WHERE data_prevista >= '2024-01-01' AND id = 42 AND idx_1 = X'AB'",
+    ])
+    assert registro['sql'] == [
+        'SELECT id FROM usuarios WHERE username = ? AND password = ? LIMIT ?',
+        'SELECT * FROM tarefas WHERE data_prevista >= ? AND id = ? AND idx_1 = ?',
+    ]
+    assert 's3cr' not in (tmp_path / 'perfil_001.json').read_text(encoding='utf-8')